@@ -1,19 +1,35 @@
 # # Add your imports here
+import asyncio
 import json
 import logging
-import time
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List
 
-import pandas as pd
-import requests
+import httpx
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # # Add any utility functions here if needed
 
 
 
 OPEN_METEO_URL = "https://archive-api.open-meteo.com/v1/archive"
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1  # seconds, doubled on each retry
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+CONCURRENCY = 8
+
+RAW_SCHEMA = pa.schema(
+    [
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        # Categorical columns: stored dictionary-encoded, one entry per distinct value
+        ("location", pa.dictionary(pa.int16(), pa.string())),
+        ("sensor_name", pa.dictionary(pa.int16(), pa.string())),
+        ("value", pa.float64()),
+    ]
+)
 
 LOCATION_COORDS = {
     "amsterdam": {"latitude": 52.37, "longitude": 4.89},
@@ -27,17 +43,36 @@ def load_tasks(repo_root: Path) -> Dict:
         return json.load(f)
 
 
-def get_sensors_for_location(config_locations: List[Dict], location_name: str) -> List[str]:
-    for loc in config_locations:
-        if loc["name"] == location_name:
-            return list(loc["sensors"])
-    raise ValueError(f"No sensors configured for location: {location_name}")
+def index_sensors_by_location(config_locations: List[Dict]) -> Dict[str, List[str]]:
+    return {loc["name"]: list(loc["sensors"]) for loc in config_locations}
 
 
-def fetch_day(location: str, date_str: str, sensors: List[str]) -> Dict:
-    
-    MAX_RETRIES = 3
-    RETRY_DELAY = 2 # seconds
+def get_sensors_for_location(sensors_by_location: Dict[str, List[str]], location_name: str) -> List[str]:
+    try:
+        return sensors_by_location[location_name]
+    except KeyError:
+        raise ValueError(f"No sensors configured for location: {location_name}") from None
+
+
+def build_client() -> httpx.AsyncClient:
+    """
+    One HTTP/2 client for the whole run so every request shares the same
+    connection pool. Retries are left to fetch_day.
+    """
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY),
+    )
+    return httpx.AsyncClient(transport=transport, timeout=60)
+
+
+async def fetch_day(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    location: str,
+    date_str: str,
+    sensors: List[str],
+) -> Dict:
     coords = LOCATION_COORDS.get(location)
     if not coords:
         raise ValueError(f"Coordinates missing for location: {location}")
@@ -50,65 +85,136 @@ def fetch_day(location: str, date_str: str, sensors: List[str]) -> Dict:
         "hourly": ",".join(sensors),
         "timezone": "UTC",
     }
-    
+
+    # Retry transport errors (connect/read timeouts, stream resets, ...) and
+    # transient statuses with exponential backoff; the last response is
+    # reported through raise_for_status() below. The semaphore is held per
+    # attempt so a task backing off does not occupy a concurrency slot.
     for attempt in range(MAX_RETRIES):
         try:
-            response = requests.get(OPEN_METEO_URL, params=params, timeout=60)
-            response.raise_for_status()
-            return response.json()
-        except requests.HTTPError as e:
-            raise requests.HTTPError(f"HTTP error for {location} {date_str}: {e}") from e
-        except Exception as e:
+            async with sem:
+                response = await client.get(OPEN_METEO_URL, params=params)
+        except httpx.TransportError:
             if attempt == MAX_RETRIES - 1:
                 raise
-            time.sleep(RETRY_DELAY)
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES - 1:
+                break
+        await asyncio.sleep(RETRY_BACKOFF * 2**attempt)
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        raise httpx.HTTPStatusError(
+            f"HTTP error for {location} {date_str}: {e}", request=e.request, response=e.response
+        ) from e
     return response.json()
 
 
-def json_to_long(df_json: Dict, location: str) -> pd.DataFrame:
+def json_to_long(df_json: Dict, location: str) -> pa.Table:
     hourly = df_json.get("hourly", {})
     times = hourly.get("time")
-    if not times:
-        return pd.DataFrame(columns=["timestamp", "location", "sensor_name", "value"])
+    sensors = [k for k in hourly if k != "time"]
+    if not times or not sensors:
+        return RAW_SCHEMA.empty_table()
+
+    # Timestamps come back as naive ISO strings in UTC (we request timezone=UTC)
+    timestamps = pa.array(times).cast(pa.timestamp("ms")).cast(RAW_SCHEMA.field("timestamp").type)
+    n = len(times)
+
+    # Long layout is sensor-major: all hours of the first sensor, then the next one
+    return pa.Table.from_arrays(
+        [
+            pa.concat_arrays([timestamps] * len(sensors)),
+            pa.DictionaryArray.from_arrays(
+                pa.array(np.zeros(n * len(sensors), dtype=np.int16)), pa.array([location])
+            ),
+            pa.DictionaryArray.from_arrays(
+                pa.array(np.repeat(np.arange(len(sensors), dtype=np.int16), n)), pa.array(sensors)
+            ),
+            pa.concat_arrays([pa.array(hourly[s], type=pa.float64()) for s in sensors]),
+        ],
+        schema=RAW_SCHEMA,
+    )
+
+
+def write_parquet(table: pa.Table, path_str: str) -> None:
+    path = Path(path_str)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        # Encode in memory and hand the file to the OS in one write; writing to
+        # a temp name and renaming means an interrupted run never leaves a
+        # truncated file behind for the idempotency check to skip
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink, compression="zstd")
+        tmp_path.write_bytes(sink.getvalue())
+        tmp_path.replace(path)
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        raise RuntimeError(f"Failed to write parquet {path}: {e}") from e
+
+
+async def scrape_task(
+    sem: asyncio.Semaphore,
+    client: httpx.AsyncClient,
+    task: Dict,
+    sensors_by_location: Dict[str, List[str]],
+) -> str:
+    """
+    Fetches, converts and writes a single (location, date) task.
+    Returns the outcome: "wrote", "skipped", "http_error" or "error".
+    """
+    location = task["location"]
+    date_str = task["date"]
+    raw_path = task["raw_path"]
+
+    # Idempotency: skip if file exists
+    if Path(raw_path).exists():
+        logging.info("Skip existing file: %s", raw_path)
+        return "skipped"
 
-    # Build wide DataFrame from hourly dict
-    data = {k: v for k, v in hourly.items() if k != "time"}
-    wide = pd.DataFrame({"time": times, **data})
+    try:
+        sensors = get_sensors_for_location(sensors_by_location, location)
+        payload = await fetch_day(client, sem, location, date_str, sensors)
+        table = json_to_long(payload, location)
+
+        # Even if empty, still create the file to mark processed.
+        # Parquet encoding runs in a worker thread so other fetches keep going.
+        await asyncio.to_thread(write_parquet, table, raw_path)
+        logging.info("Wrote %s (%d rows)", raw_path, table.num_rows)
+        return "wrote"
+    except httpx.HTTPStatusError as e:
+        logging.error("HTTP error for %s %s: %s", location, date_str, e)
+        return "http_error"
+    except RuntimeError as e:  # catches write_parquet failure
+        logging.error("Failed to write data for %s %s: %s", location, date_str, e)
+        return "error"
+    except Exception as e:
+        logging.error("Failed for %s %s: %s", location, date_str, e)
+        return "error"
 
-    # Normalize timestamp to UTC (as naive datetime for parquet compatibility)
-    wide["timestamp"] = pd.to_datetime(wide["time"], utc=True)
-    
-    wide = wide.drop(columns=["time"])
 
-    # Melt to long
-    long_df = wide.melt(id_vars=["timestamp"], var_name="sensor_name", value_name="value")
-    long_df["location"] = location
+async def scrape_async():
+    repo_root = Path(__file__).resolve().parents[2]  # project root
+    config = load_tasks(repo_root)
 
-    # Reorder and ensure dtype
-    long_df = long_df[["timestamp", "location", "sensor_name", "value"]]
-    # Convert timezone-aware to naive UTC (datetime64[ms] doesn't support timezone-aware)
-    # Convert each timestamp: ensure UTC, then make naive
-    # long_df["timestamp"] = long_df["timestamp"].apply(
-    #     lambda x: x.tz_convert("UTC").replace(tzinfo=None) if x.tz is not None else x
-    # )
-    # long_df["timestamp"] = long_df["timestamp"].astype("datetime64[ms]")
-    # long_df.info()
+    tasks = config.get("tasks", [])
+    # Built once so each task's sensor lookup is a dict hit, not a scan
+    sensors_by_location = index_sensors_by_location(config.get("locations", []))
 
-    return long_df
+    # Tasks are independent; keep at most CONCURRENCY requests in flight
+    sem = asyncio.Semaphore(CONCURRENCY)
+    async with build_client() as client:
+        results = await asyncio.gather(
+            *(scrape_task(sem, client, task, sensors_by_location) for task in tasks)
+        )
 
+    total = results.count("wrote")
+    skipped = results.count("skipped")
+    errors = results.count("http_error") + results.count("error")
+    errored = [task["date"] for task, result in zip(tasks, results) if result == "http_error"]
 
-def write_parquet(df: pd.DataFrame, path_str: str) -> None:
-    path = Path(path_str)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    try:
-        df.to_parquet(path, index=False)
-    except Exception as e:
-        # Likely missing pyarrow/fastparquet
-        raise RuntimeError(
-            "Failed to write parquet. Ensure 'pyarrow' is installed: "
-            "uv add pyarrow"
-        ) from e
-
+    logging.info("Scrape done. wrote=%d skipped=%d errors=%d errored=%s", total, skipped, errors, errored)
 
 
 def scrape():
@@ -120,52 +226,8 @@ def scrape():
 #     raise NotImplementedError
 
     logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
-    repo_root = Path(__file__).resolve().parents[2]  # project root
-    config = load_tasks(repo_root)
-
-    tasks = config.get("tasks", [])
-    locations_cfg = config.get("locations", [])
-
-    total = 0
-    skipped = 0
-    errors = 0
-    errored = []
-
-    for task in tasks:
-        location = task["location"]
-        date_str = task["date"]
-        raw_path = task["raw_path"]
-
-        # Idempotency: skip if file exists
-        if Path(raw_path).exists():
-            skipped += 1
-            logging.info("Skip existing file: %s", raw_path)
-            continue
-
-        try:
-            sensors = get_sensors_for_location(locations_cfg, location)
-            payload = fetch_day(location, date_str, sensors)
-            df_long = json_to_long(payload, location)
-
-            # Even if empty, still create the file to mark processed
-            write_parquet(df_long, raw_path)
-            total += 1
-            logging.info("Wrote %s (%d rows)", raw_path, len(df_long))
-        except requests.HTTPError as e:
-            errored.append(date_str)
-            errors += 1
-            logging.error("HTTP error for %s %s: %s", location, date_str, e)
-            
-        except RuntimeError as e:  # catches fetch_day retry failure
-            errors += 1
-            logging.error("Failed to fetch data for %s %s after retries: %s", location, date_str, e)
-
-        
-        except Exception as e:
-            errors += 1
-            logging.error("Failed for %s %s: %s", location, date_str, e)
-
-    logging.info("Scrape done. wrote=%d skipped=%d errors=%d errored=%s", total, skipped, errors, errored)
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # per-request lines are noise here
+    asyncio.run(scrape_async())
 
 
 if __name__ == "__main__":
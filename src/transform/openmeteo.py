@@ -1,16 +1,31 @@
 # Add your imports here
 import json
 import logging
+import os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Tuple
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet
 
 import pandas as pd
 
 
 
+RAW_SCHEMA = pa.schema(
+    [
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        ("location", pa.string()),
+        ("sensor_name", pa.string()),
+        ("value", pa.float64()),
+    ]
+)
+
+
 # Add any utility functions here if needed
 def load_tasks(repo_root: Path) -> Dict:
     tasks_path = repo_root / "tasks.json"
@@ -39,62 +54,103 @@ def  group_tasks_by_location_month(tasks: List[Dict]) -> Dict[Tuple[str, str], D
     return grouped
 
 
-def  read_raw_long(paths: List[str]) -> pd.DataFrame:
-    frames: List[pd.DataFrame] = []
-    for p in paths:
-        path = Path(p)
-        if not path.exists():
-            continue
+def  read_raw_long(paths: List[str]) -> Tuple[pa.Table, List[str]]:
+    """
+    Scans all existing daily raw files in one pass. Files are read with the
+    canonical raw schema, so older ns-precision files are cast to ms and
+    dictionary-encoded string columns are decoded (pivot_wider needs plain
+    string keys) on read.
+    Returns the rows read and the paths of files that could not be read.
+    """
+    existing = [p for p in paths if Path(p).exists()]
+    if not existing:
+        return RAW_SCHEMA.empty_table(), []
+    try:
+        return _scan_raw(existing), []
+    except (OSError, pa.ArrowException):
+        pass
+
+    # Some file is unreadable (e.g. truncated by an interrupted run): read the
+    # files one by one and drop only the ones that fail
+    tables: List[pa.Table] = []
+    unreadable: List[str] = []
+    for p in existing:
         try:
-            df = pd.read_parquet(path)
-            frames.append(df)
-        except Exception as e:
+            tables.append(_scan_raw([p]))
+        except (OSError, pa.ArrowException) as e:
             logging.error("Failed reading raw parquet %s: %s", p, e)
-    if not frames:
-        return pd.DataFrame(columns=["timestamp", "location", "sensor_name", "value"])
-    df_all = pd.concat(frames, ignore_index=True)
-    # Ensure expected columns exist
-    expected_cols = {"timestamp", "location", "sensor_name", "value"}
-    missing = expected_cols - set(df_all.columns)
-    if missing:
-        raise ValueError(f"Missing columns in raw data: {missing}")
-    # Normalize timestamp to ms precision, naive UTC
-    # df_all["timestamp"] = pd.to_datetime(df_all["timestamp"], utc=True).astype("datetime64[ms]")
-    return df_all
-
-
-def  long_to_wide(df_long: pd.DataFrame) -> pd.DataFrame:
-    if df_long.empty:
+            unreadable.append(p)
+    if not tables:
+        return RAW_SCHEMA.empty_table(), unreadable
+    return pa.concat_tables(tables), unreadable
+
+
+def _scan_raw(paths: List[str]) -> pa.Table:
+    dataset = ds.dataset(paths, format="parquet", schema=RAW_SCHEMA)
+    return dataset.to_table(columns=RAW_SCHEMA.names)
+
+
+def _pivot_sensors(table: pa.Table, value_col: str, sensor_cols: List[str]) -> pa.Table:
+    # Raises ArrowInvalid if a (timestamp, location) group has two values for a sensor
+    return table.group_by(["timestamp", "location"], use_threads=False).aggregate(
+        [(["sensor_name", value_col], "pivot_wider", pc.PivotWiderOptions(key_names=sensor_cols))]
+    )
+
+
+def  long_to_wide(table: pa.Table) -> pd.DataFrame:
+    if table.num_rows == 0:
         return pd.DataFrame(columns=["timestamp", "location"])
+    # Order columns: timestamp, location, sensors (alphabetical)
+    sensor_cols = sorted(pc.unique(table["sensor_name"]).to_pylist())
+    try:
+        pivoted = _pivot_sensors(table, "value", sensor_cols)
+    except pa.ArrowInvalid:
+        # The same reading appears more than once (e.g. overlapping raw files):
+        # keep the last one per key, then pivot. Ordered aggregation needs
+        # use_threads=False
+        deduped = table.group_by(
+            ["timestamp", "location", "sensor_name"], use_threads=False
+        ).aggregate([("value", "last")])
+        pivoted = _pivot_sensors(deduped, "value_last", sensor_cols)
+    sensors = pivoted.column(pivoted.column_names[-1]).combine_chunks()
+    # Match pivot_table(dropna=True): drop sensors that are null throughout,
+    # and (timestamp, location) rows where every sensor is null
+    sensor_cols = [name for name in sensor_cols if sensors.field(name).null_count < len(sensors)]
+    has_reading = pa.array([False] * len(sensors))
+    for name in sensor_cols:
+        has_reading = pc.or_(has_reading, pc.is_valid(sensors.field(name)))
     wide = (
-        df_long.pivot_table(
-            index=["timestamp", "location"],
-            columns="sensor_name",
-            values="value",
-            aggfunc="last",
+        pa.table(
+            {
+                "timestamp": pivoted["timestamp"],
+                "location": pivoted["location"],
+                **{name: sensors.field(name) for name in sensor_cols},
+            }
         )
-        .reset_index()
+        .filter(has_reading)
+        .sort_by([("timestamp", "ascending"), ("location", "ascending")])
     )
-    # Flatten columns (pivot creates MultiIndex on columns)
-    wide.columns.name = None
-    # Ensure timestamp dtype and ordering
-    # wide["timestamp"] = pd.to_datetime(wide["timestamp"], utc=False).astype("datetime64[ms]")
-    # Order columns: timestamp, location, sensors (alphabetical)
-    fixed_cols = ["timestamp", "location"]
-    sensor_cols = sorted([c for c in wide.columns if c not in fixed_cols])
-    wide = wide[fixed_cols + sensor_cols]
+    wide = wide.to_pandas()
     wide.rename(columns = {'dew_point_2m':'dew_point'}, inplace= True)
     return wide
 
 
-def  merge_with_historical(wide_new: pd.DataFrame, structured_path: str) -> pd.DataFrame:
+def  merge_with_historical(wide_new: pd.DataFrame, structured_path: str) -> Tuple[pd.DataFrame, bool]:
+    """
+    Merges new wide rows into the month's historical data.
+    Returns the merged frame and whether it differs from what is already on
+    disk, so callers can skip rewriting a month that gained nothing new.
+    """
     path = Path(structured_path)
     if path.exists():
         try:
-            hist = pd.read_parquet(path)
-            # Fix duplicate column names if any (defensive)
-            if hist.columns.duplicated().any():
-                hist = hist.loc[:, ~hist.columns.duplicated()]
+            table = pa.parquet.read_table(path)
+            # Truncate timestamps to ms as an arrow cast (a no-op on files we
+            # wrote, which are already ms) instead of a pandas dt.round pass
+            ts_idx = table.schema.get_field_index("timestamp")
+            ts_type = pa.timestamp("ms", tz=table.schema.field(ts_idx).type.tz)
+            table = table.set_column(ts_idx, "timestamp", table["timestamp"].cast(ts_type, safe=False))
+            hist = table.to_pandas()
             # Normalize timestamp dtype for safe concat
             # Handle timezone-aware timestamps from historical data
             # hist["timestamp"] = pd.to_datetime(hist["timestamp"], utc=True)
@@ -103,7 +159,6 @@ def  merge_with_historical(wide_new: pd.DataFrame, structured_path: str) -> pd.D
             #     lambda x: x.tz_convert("UTC").replace(tzinfo=None) if x.tz is not None else x
             # )
             # hist["timestamp"] = hist["timestamp"].astype("datetime64[ms]")
-            hist["timestamp"] = hist["timestamp"].dt.round("ms")
 
         except Exception as e:
             logging.error("Failed reading historical parquet %s: %s", structured_path, e)
@@ -112,34 +167,77 @@ def  merge_with_historical(wide_new: pd.DataFrame, structured_path: str) -> pd.D
         hist = pd.DataFrame(columns=wide_new.columns)
 
     # Handle empty DataFrames to avoid FutureWarning
-    # Align columns before concatenation (hist and new might have different sensors)
     if hist.empty:
-        combined = wide_new.copy()
+        combined = wide_new
     elif wide_new.empty:
-        combined = hist.copy()
+        combined = hist
     else:
-        # Ensure both have the same columns (fill missing with NaN)
-        # Keep order: timestamp, location, then sensors (alphabetically sorted)
-        fixed_cols = ["timestamp", "location"]
-        all_sensors = sorted(set(hist.columns) | set(wide_new.columns) - set(fixed_cols))
-        all_columns = fixed_cols + all_sensors
-        hist = hist.reindex(columns=all_columns)
-        wide_new = wide_new.reindex(columns=all_columns)
+        # Diagonal concat: sensors missing on either side are filled with NaN,
+        # so no per-frame reindex copies are needed
         combined = pd.concat([hist, wide_new], ignore_index=True)
     
-    # Fix duplicate column names if any (defensive)
-    if combined.columns.duplicated().any():
-        combined = combined.loc[:, ~combined.columns.duplicated()]
-    
-    # Drop duplicates on (timestamp, location), keep the latest
-    combined = combined.sort_values("timestamp")
+    # Drop duplicates on (timestamp, location) before sorting; new rows come
+    # after historical ones, so keep="last" lets them win
     combined = combined.drop_duplicates(subset=["timestamp", "location"], keep="last")
-    # Columns are already in correct order from above, but ensure consistency
+    combined = combined.sort_values("timestamp", kind="stable")
+    # Order columns: timestamp, location, sensors (alphabetical)
     fixed_cols = ["timestamp", "location"]
     sensor_cols = sorted([c for c in combined.columns if c not in fixed_cols])
-    combined = combined[fixed_cols + sensor_cols]
-    
-    return combined
+    combined = combined[fixed_cols + sensor_cols].reset_index(drop=True)
+
+    # Re-runs over already merged raw files reproduce the historical frame
+    changed = not combined.equals(hist.reset_index(drop=True))
+    return combined, changed
+
+
+def  can_append(wide_new: pd.DataFrame, structured_path: str) -> bool:
+    """
+    True when the new rows can be appended to the existing monthly file as-is:
+    same columns, and every new timestamp is later than anything stored, as
+    shown by the row-group statistics. No data pages are read.
+    """
+    path = Path(structured_path)
+    if wide_new.empty or not path.exists():
+        return False
+    try:
+        meta = pa.parquet.ParquetFile(path).metadata
+    except Exception as e:
+        logging.error("Failed reading parquet metadata %s: %s", structured_path, e)
+        return False
+    schema = meta.schema.to_arrow_schema()
+    if schema.names != list(wide_new.columns):
+        return False
+    # wide_new is sorted by timestamp
+    new_min = wide_new["timestamp"].iloc[0]
+    ts_idx = schema.get_field_index("timestamp")
+    for i in range(meta.num_row_groups):
+        stats = meta.row_group(i).column(ts_idx).statistics
+        if stats is None or not stats.has_min_max or stats.max >= new_min:
+            return False
+    return True
+
+
+def  append_structured(wide_new: pd.DataFrame, structured_path: str) -> None:
+    """
+    Appends new rows without merging: the existing month is read as an arrow
+    table and concatenated with the new rows, skipping the pandas round-trip,
+    sort and dedupe. It is still decoded and re-encoded, but written as one
+    table so daily appends do not pile up small row groups. Parquet files
+    cannot be extended in place, so the result is written next to the
+    original and swapped in.
+    """
+    path = Path(structured_path)
+    # Drop the pandas metadata: its RangeIndex length would no longer match
+    existing = pa.parquet.read_table(path).replace_schema_metadata()
+    new_table = pa.Table.from_pandas(wide_new, schema=existing.schema, preserve_index=False)
+    combined = pa.concat_tables([existing, new_table.replace_schema_metadata()])
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        pa.parquet.write_table(combined, tmp_path, compression="zstd")
+        tmp_path.replace(path)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
 
 def  write_structured(df: pd.DataFrame, path_str: str) -> None:
@@ -148,7 +246,74 @@ def  write_structured(df: pd.DataFrame, path_str: str) -> None:
     
     # df.to_parquet(path, index=False)
     table = pa.Table.from_pandas(df, preserve_index=False)   # preserve_index as needed
-    pa.parquet.write_table(table, path, coerce_timestamps="ms")
+    pa.parquet.write_table(table, path, coerce_timestamps="ms", compression="zstd")
+
+
+def _configure_logging() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+
+def _process_group(location: str, yyyymm: str, info: Dict) -> str:
+    """
+    Transforms one (location, month) group into its structured file.
+    Returns the outcome: "processed", "skipped", "unchanged" or "failed".
+    A group with unreadable raw files counts as "failed" even if the readable
+    files were merged.
+    """
+    raw_paths = sorted(set(info["raw_paths"]))
+    structured_path = info["structured_path"]
+
+    long_table, unreadable =  read_raw_long(raw_paths)
+    if long_table.num_rows == 0 and not unreadable:
+        logging.info("No raw data for %s %s; skipping.", location, yyyymm)
+        return "skipped"
+
+    outcome = "failed"
+    if long_table.num_rows > 0:
+        outcome = _write_group(location, yyyymm, long_table, structured_path)
+    if unreadable:
+        logging.error(
+            "%d unreadable raw file(s) left out of %s %s", len(unreadable), location, yyyymm
+        )
+        return "failed"
+    return outcome
+
+
+def _write_group(location: str, yyyymm: str, long_table: pa.Table, structured_path: str) -> str:
+    wide_new =  long_to_wide(long_table)
+    if can_append(wide_new, structured_path):
+        # Only newer timestamps: nothing to dedupe, skip the full merge
+        try:
+            append_structured(wide_new, structured_path)
+            logging.info(
+                "Appended %d rows to %s for %s %s",
+                len(wide_new),
+                structured_path,
+                location,
+                yyyymm,
+            )
+            return "processed"
+        except Exception as e:
+            logging.error("Failed appending to structured parquet %s: %s", structured_path, e)
+            return "failed"
+
+    merged, changed =  merge_with_historical(wide_new, structured_path)
+    if not changed:
+        logging.info("%s already up to date for %s %s; not rewriting.", structured_path, location, yyyymm)
+        return "unchanged"
+    try:
+        write_structured(merged, structured_path)
+        logging.info(
+            "Wrote %s for %s %s (%d rows)",
+            structured_path,
+            location,
+            yyyymm,
+            len(merged),
+        )
+        return "processed"
+    except Exception as e:
+        logging.error("Failed writing structured parquet %s: %s", structured_path, e)
+        return "failed"
 
 
 def transform():
@@ -160,7 +325,7 @@ def transform():
     # 5. Merge new data with historical data (handle duplicates and schema differences)
     # 6. Write monthly parquet files to structured_output_dir
 
-    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    _configure_logging()
     repo_root = Path(__file__).resolve().parents[2]  # project root
     cfg =  load_tasks(repo_root)
 
@@ -171,34 +336,31 @@ def transform():
 
     groups =  group_tasks_by_location_month(tasks)
 
-    processed = 0
-    skipped = 0
-    for (location, yyyymm), info in groups.items():
-        raw_paths = sorted(set(info["raw_paths"]))
-        structured_path = info["structured_path"]
-
-        df_long =  read_raw_long(raw_paths)
-        if df_long.empty:
-            skipped += 1
-            logging.info("No raw data for %s %s; skipping.", location, yyyymm)
-            continue
-
-        wide_new =  long_to_wide(df_long)
-        merged =  merge_with_historical(wide_new, structured_path)
-        try:
-            write_structured(merged, structured_path)
-            processed += 1
-            logging.info(
-                "Wrote %s for %s %s (%d rows)",
-                structured_path,
-                location,
-                yyyymm,
-                len(merged),
+    # Each group writes its own structured file, so groups run in separate
+    # processes (the pandas/pyarrow work is GIL-bound); counts are tallied here
+    keys = list(groups)
+    max_workers = min(len(keys), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_configure_logging) as executor:
+        outcomes = list(
+            executor.map(
+                _process_group,
+                [location for location, _ in keys],
+                [yyyymm for _, yyyymm in keys],
+                [groups[key] for key in keys],
             )
-        except Exception as e:
-            logging.error("Failed writing structured parquet %s: %s", structured_path, e)
+        )
 
-    logging.info("Transform done. processed=%d skipped=%d", processed, skipped)
+    processed = outcomes.count("processed")
+    skipped = outcomes.count("skipped")
+    unchanged = outcomes.count("unchanged")
+    failed = outcomes.count("failed")
+    logging.info(
+        "Transform done. processed=%d skipped=%d unchanged=%d failed=%d",
+        processed,
+        skipped,
+        unchanged,
+        failed,
+    )
 
 
 if __name__ == "__main__":